@@ -1,205 +1,233 @@
 import streamlit as st
-import akshare as ak
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import os
-import time
-import random
-from datetime import datetime
-
-# --- 环境加固 ---
-os.environ['NO_PROXY'] = '*'
-st.set_page_config(page_title="爆发增强策略交互回测 Pro", layout="wide")
-
-# --- 中文支持（兼容 Linux 容器）---
-try:
-    plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-except:
-    pass
-plt.rcParams['axes.unicode_minus'] = False
-
-st.title("🛡️ 爆发增强策略 Pro - 自动化交互回测系统")
-st.markdown("该系统针对 **RemoteDisconnected** 及 **字段变更** 进行了底层加固，适配 GitHub + Streamlit Cloud 部署。")
-
-# --- 侧边栏配置 ---
-st.sidebar.header("回测配置")
-stock_code = st.sidebar.text_input("输入 A 股代码 (如 001255)", value="001255").strip()
-start_date = st.sidebar.date_input("起始日期", value=pd.to_datetime("2024-01-01"))
-end_date = st.sidebar.date_input("结束日期", value=pd.to_datetime("2026-02-24"))
-init_cash = st.sidebar.number_input("初始模拟资金 (元)", value=100000, min_value=1000)
-
-# --- 数据抓取函数（带字段兼容与重试）---
-@st.cache_data(ttl=600)
-def fetch_data_robust(code: str, start, end):
-    s_str = start.strftime('%Y%m%d')
-    e_str = end.strftime('%Y%m%d')
-    
-    for attempt in range(3):
-        try:
-            time.sleep(random.uniform(1.5, 3.0))  # 模拟人工延迟
-            df = ak.stock_zh_a_hist(
-                symbol=code,
-                period="daily",
-                start_date=s_str,
-                end_date=e_str,
-                adjust="qfq"
-            )
-            
-            if df is None or df.empty:
-                continue
-
-            # 字段映射：兼容 AkShare 不同版本（2024-2026）
-            col_map = {
-                '日期': 'date',
-                '收盘': 'close',
-                '收盘价': 'close',
-                '最高': 'high',
-                '最高价': 'high',
-                '最低': 'low',
-                '最低价': 'low',
-                '涨跌幅': 'pct_chg'
-            }
-            df = df.rename(columns={k: v for k, v in col_map.items() if k in df.columns})
-
-            required_cols = ['date', 'close', 'high', 'low']
-            if not all(col in df.columns for col in required_cols):
-                st.warning(f"数据缺失关键字段: {df.columns.tolist()}")
-                return None
-
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.sort_values('date').reset_index(drop=True)
-
-            # 补全 pct_chg
-            if 'pct_chg' not in df.columns:
-                df['pct_chg'] = df['close'].pct_change() * 100
-
-            # 合并上证指数（用于大盘环境判断）
-            try:
-                idx_df = ak.stock_zh_index_daily(symbol="sh000001")
-                idx_df['date'] = pd.to_datetime(idx_df['date'])
-                idx_df = idx_df[['date', 'close']].rename(columns={'close': 'idx_c'})
-                df = pd.merge(df, idx_df, on='date', how='left')
-                df['idx_c'] = df['idx_c'].fillna(method='ffill')  # 前向填充避免 NaN
-            except Exception as e:
-                st.warning("⚠️ 无法获取上证指数，使用股价自身替代大盘信号（策略效果可能下降）")
-                df['idx_c'] = df['close']
-
-            return df
-
-        except Exception as e:
-            if attempt == 2:
-                st.error(f"❌ 数据获取失败（{code}）: {str(e)[:200]}")
-                return None
+import altair as alt
+
+from engine import Bars, FetchError, add_signals, fetch_bars, grid_search, run_backtest
+
+# 降级行情（离线快照 / 指数缺失）只用于本次运行：带着数据抛出，st.cache_data 不缓存异常，
+# 数据源恢复后下一次运行即取到正常结果
+class DegradedData(Exception):
+    def __init__(self, df):
+        super().__init__(df.attrs['notice'])
+        self.df = df
+
+# 指标与信号（列式数组，不经过 DataFrame）
+def _signals(df):
+    return add_signals(Bars.from_frame(df))
+
+# --- 回测流程：分两级缓存 ---
+# 行情 + 指标信号只取决于代码与日期；只改初始资金时直接复用，仅重跑交易模拟
+@st.cache_data(ttl=3600, max_entries=32, show_spinner="📡 正在穿透数据拦截...（首次加载较慢，请耐心等待）")
+def load_signals(symbol: str, start, end):
+    df = fetch_bars(symbol, start, end)
+    if df is None or df.empty:
+        return None
+    if df.attrs.get('notice'):
+        raise DegradedData(df)
+    return _signals(df)
+
+# 完整结果按全部输入参数缓存：参数不变的重复运行直接复用
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def run_strategy(symbol: str, start, end, capital):
+    bars = load_signals(symbol, start, end)
+    if bars is None:
+        return None
+    return _strategy(bars, capital)
+
+def _strategy(bars, capital):
+    # 交易模拟
+    balance, trade_logs = run_backtest(bars, capital)
+
+    final_value = float(balance[-1])
+    total_return = (final_value - capital) / capital * 100
+    signal_count = int(bars.xg.sum())
+    # 只在最后拼出展示用的几列
+    chart_df = pd.DataFrame({
+        'date': bars.date, 'close': bars.close, 'ma7': bars.ma7, 'xg': bars.xg, 'balance': balance,
+    })
+    return chart_df, trade_logs, final_value, total_return, signal_count
+
+# --- 结果展示 ---
+TRADE_TABLE_ROWS = 200  # 交易明细表最多渲染的行数
+
+def render(results, symbol: str, capital):
+    df, trade_logs, final_value, total_return, signal_count = results
+
+    st.subheader("📊 策略回测绩效清单")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("期末总资产", f"¥{final_value:,.2f}")
+    col2.metric("累积回报率", f"{total_return:.2f}%")
+    col3.metric("有效信号次数", signal_count)
+
+    # 图表绘制（Vega-Lite 由浏览器端渲染，服务器不再栅格化 PNG，也无需加载中文字体）
+    plot_df = df[['date', 'close', 'ma7', 'balance']].rename(
+        columns={'close': '股价', 'ma7': 'MA7 支撑', 'balance': '账户资产'}
+    )
+    x_axis = alt.X('date:T', title=None)
+
+    price_lines = alt.Chart(plot_df).transform_fold(
+        ['股价', 'MA7 支撑'], as_=['series', 'value']
+    ).mark_line(strokeWidth=1).encode(
+        x=x_axis,
+        y=alt.Y('value:Q', title=None, scale=alt.Scale(zero=False)),
+        color=alt.Color('series:N', title=None,
+                        scale=alt.Scale(domain=['股价', 'MA7 支撑'], range=['#1f77b4', 'cyan'])),
+    )
+    signal_mask = df['xg'].to_numpy()
+    signal_df = pd.DataFrame({
+        'date': df['date'].to_numpy()[signal_mask],
+        '股价': df['close'].to_numpy()[signal_mask],
+    })
+    signal_points = alt.Chart(signal_df).mark_point(
+        shape='triangle-up', color='red', filled=True, size=80
+    ).encode(x=x_axis, y='股价:Q', tooltip=['date:T', '股价:Q'])
+    st.altair_chart(
+        (price_lines + signal_points).properties(title=f"{symbol} 信号与趋势分布图", height=420),
+        use_container_width=True,
+    )
+
+    balance_line = alt.Chart(plot_df).mark_line(color='orange', strokeWidth=1.5).encode(
+        x=x_axis, y=alt.Y('账户资产:Q', title=None, scale=alt.Scale(zero=False))
+    )
+    init_rule = alt.Chart(pd.DataFrame({'初始资金': [capital]})).mark_rule(
+        color='red', strokeDash=[6, 4]
+    ).encode(y='初始资金:Q')
+    st.altair_chart(
+        (balance_line + init_rule).properties(title="资产累积收益曲线", height=260),
+        use_container_width=True,
+    )
+
+    # 交易记录
+    if not trade_logs.empty:
+        st.subheader("📋 详细区间交易收益清单")
+        # 最近的交易排在前面，页面只发送前 TRADE_TABLE_ROWS 笔，完整记录走 CSV 下载
+        recent = trade_logs.sort_values("卖出日期", ascending=False, kind="stable").head(TRADE_TABLE_ROWS)
+        st.dataframe(
+            recent,
+            use_container_width=True,
+            height=400,
+            hide_index=True,
+            column_config={
+                "买入价": st.column_config.NumberColumn(format="%.2f"),
+                "卖出价": st.column_config.NumberColumn(format="%.2f"),
+                "区间净收益": st.column_config.NumberColumn(format="%.2f%%"),
+            },
+        )
+        if len(trade_logs) > TRADE_TABLE_ROWS:
+            st.caption(f"共 {len(trade_logs)} 笔交易，表格仅显示最近 {TRADE_TABLE_ROWS} 笔。")
+        st.download_button(
+            "⬇️ 下载完整交易记录 (CSV)",
+            trade_logs.to_csv(index=False).encode("utf-8-sig"),  # 带 BOM，Excel 直接打开中文不乱码
+            file_name=f"{symbol}_trades.csv",
+            mime="text/csv",
+        )
+    else:
+        st.info("所选时间段内未触发符合条件的爆发信号。")
+
+# --- 参数寻优：对 XG 阈值做网格搜索（行情与默认信号复用 load_signals 缓存）---
+GRID_COLUMNS = {
+    'pct_thr': '近30日涨幅阈值',
+    'q2_floor': 'Q2 下限',
+    'max_dev': 'MA7 偏离上限',
+    'n_trades': '交易次数',
+    'total_return': '累积回报率',
+    'sharpe': '夏普比率',
+    'max_drawdown': '最大回撤',
+}
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner="🔍 正在回测各组参数...")
+def run_grid(symbol: str, start, end, capital, pct_thrs, q2_floors, max_devs):
+    bars = load_signals(symbol, start, end)
+    if bars is None:
+        return None
+    return _grid(bars, capital, pct_thrs, q2_floors, max_devs)
+
+def _grid(bars, capital, pct_thrs, q2_floors, max_devs):
+    rows = grid_search(bars, capital, pct_thrs, q2_floors, max_devs)
+    grid_df = pd.DataFrame(rows).drop(columns='capital').rename(columns=GRID_COLUMNS)
+    return grid_df.sort_values('夏普比率', ascending=False, ignore_index=True)
+
+def render_grid(grid_df):
+    st.dataframe(
+        grid_df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "累积回报率": st.column_config.NumberColumn(format="%.2f%%"),
+            "夏普比率": st.column_config.NumberColumn(format="%.2f"),
+            "最大回撤": st.column_config.NumberColumn(format="%.2f%%"),
+        },
+    )
+
+def _valid_code(code: str):
+    if code.isdigit() and len(code) == 6:
+        return True
+    st.error("请输入有效的 6 位 A 股代码（如 001255）")
+    return False
+
+# 正常结果走缓存；降级数据提示后现算一次、不入缓存；实时与离线都取不到时返回 None
+def _run(cached, compute, symbol, start, end, *args):
+    try:
+        return cached(symbol, start, end, *args)
+    except FetchError as e:
+        st.error(f"❌ {e}")
+    except DegradedData as e:
+        st.warning(str(e))
+        return compute(_signals(e.df), *args)
     return None
 
-# --- 主逻辑：回测按钮触发 ---
-if st.sidebar.button("🚀 启动严谨逻辑回测"):
-    if not stock_code.isdigit() or len(stock_code) != 6:
-        st.error("请输入有效的 6 位 A 股代码（如 001255）")
-    else:
-        with st.spinner("📡 正在穿透数据拦截...（首次加载较慢，请耐心等待）"):
-            df = fetch_data_robust(stock_code, start_date, end_date)
-
-        if df is not None and not df.empty:
-            # === 1. 计算技术指标 ===
-            df['ma7'] = df['close'].rolling(window=7, min_periods=1).mean()
-            df['idx_ma5'] = df['idx_c'].rolling(window=5, min_periods=1).mean()
-
-            # Q2 动能指标（双EMA平滑）
-            q1 = df['close'].diff()
-            q_ema1 = q1.ewm(span=6, adjust=False).mean()
-            q_ema2 = q_ema1.ewm(span=6, adjust=False).mean()
-            q_abs_ema1 = q1.abs().ewm(span=6, adjust=False).mean()
-            q_abs_ema2 = q_abs_ema1.ewm(span=6, adjust=False).mean()
-            df['q2'] = 100 * q_ema2 / (q_abs_ema2 + 1e-8)  # 防除零
-
-            # === 2. 信号生成 (XG) ===
-            df['xg'] = (
-                (df['idx_c'] > df['idx_ma5']) &
-                (df['pct_chg'].rolling(window=30, min_periods=1).max() > 9.5) &
-                (df['q2'] > df['q2'].shift(1)) &
-                (df['q2'] > -20) &
-                (df['ma7'] > df['ma7'].shift(1)) &
-                (df['close'] > df['high'].shift(1)) &
-                (((df['close'] - df['ma7']) / df['ma7'] * 100) <= 3)
-            )
-
-            # === 3. 交易模拟引擎 ===
-            cash = float(init_cash)
-            shares = 0.0
-            stop_low = 0.0
-            history = []
-            trade_logs = []
-            buy_date, buy_price = None, 0.0
-
-            for i in range(len(df)):
-                row = df.iloc[i]
-                current_balance = cash + shares * row['close']
-                history.append(current_balance)
-
-                # 卖出条件：持仓中 & 触发止损
-                if shares > 0:
-                    if row['close'] < stop_low or row['close'] < row['ma7']:
-                        sell_price = row['close']
-                        ret_pct = (sell_price - buy_price) / buy_price * 100
-                        cash = shares * sell_price
-                        trade_logs.append({
-                            "买入日期": buy_date.date(),
-                            "卖出日期": row['date'].date(),
-                            "买入价": f"{buy_price:.2f}",
-                            "卖出价": f"{sell_price:.2f}",
-                            "区间净收益": f"{ret_pct:.2f}%"
-                        })
-                        shares = 0.0
-
-                # 买入条件：信号触发 & 无持仓
-                if row['xg'] and shares == 0:
-                    buy_date = row['date']
-                    buy_price = row['close']
-                    shares = cash / buy_price
-                    cash = 0.0
-                    stop_low = row['low']  # 止损设为当日最低价
-
-            df['balance'] = history
-
-            # === 4. 结果展示 ===
-            final_value = df['balance'].iloc[-1]
-            total_return = (final_value - init_cash) / init_cash * 100
-            signal_count = df['xg'].sum()
-
-            st.subheader("📊 策略回测绩效清单")
-            col1, col2, col3 = st.columns(3)
-            col1.metric("期末总资产", f"¥{final_value:,.2f}")
-            col2.metric("累积回报率", f"{total_return:.2f}%")
-            col3.metric("有效信号次数", int(signal_count))
-
-            # 图表绘制
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), gridspec_kw={'height_ratios': [2, 1]})
-            
-            ax1.plot(df['date'], df['close'], label='股价', alpha=0.7, linewidth=1)
-            ax1.plot(df['date'], df['ma7'], label='MA7 支撑', color='cyan', linewidth=1)
-            signals = df[df['xg']]
-            if not signals.empty:
-                ax1.scatter(signals['date'], signals['close'], color='red', marker='^', s=80, label='爆发信号')
-            ax1.set_title(f"{stock_code} 信号与趋势分布图", fontsize=14)
-            ax1.legend()
-            ax1.grid(True, linestyle='--', alpha=0.5)
-
-            ax2.plot(df['date'], df['balance'], label='账户资产', color='orange', linewidth=1.5)
-            ax2.axhline(init_cash, color='red', linestyle='--', label='初始资金')
-            ax2.set_title("资产累积收益曲线", fontsize=14)
-            ax2.legend()
-            ax2.grid(True, linestyle='--', alpha=0.5)
-
-            st.pyplot(fig)
-
-            # 交易记录
-            if trade_logs:
-                st.subheader("📋 详细区间交易收益清单")
-                st.dataframe(pd.DataFrame(trade_logs), use_container_width=True)
+# --- 页面入口 ---
+def main():
+    st.set_page_config(page_title="爆发增强策略交互回测 Pro", layout="wide")
+
+    st.title("🛡️ 爆发增强策略 Pro - 自动化交互回测系统")
+    st.markdown("该系统针对 **RemoteDisconnected** 及 **字段变更** 进行了底层加固，适配 GitHub + Streamlit Cloud 部署。")
+
+    # --- 侧边栏配置 ---
+    st.sidebar.header("回测配置")
+    stock_code = st.sidebar.text_input("输入 A 股代码 (如 001255)", value="001255").strip()
+    start_date = st.sidebar.date_input("起始日期", value=pd.to_datetime("2024-01-01"))
+    end_date = st.sidebar.date_input("结束日期", value=pd.to_datetime("2026-02-24"))
+    init_cash = st.sidebar.number_input("初始模拟资金 (元)", value=100000, min_value=1000)
+
+    tab_bt, tab_grid = st.tabs(["📈 单次回测", "🔍 参数寻优"])
+
+    # --- 主逻辑：回测按钮触发 ---
+    # 按钮只在点击的那次重跑为 True；参数记入 session_state，下载等交互引发的重跑仍按同一组参数
+    # 从 run_strategy 缓存重新渲染，结果不会消失
+    if st.sidebar.button("🚀 启动严谨逻辑回测") and _valid_code(stock_code):
+        st.session_state["bt_params"] = (stock_code, start_date, end_date, init_cash)
+    with tab_bt:
+        bt_params = st.session_state.get("bt_params")
+        if bt_params is not None:
+            symbol, start, end, capital = bt_params
+            results = _run(run_strategy, _strategy, symbol, start, end, capital)
+            if results is not None:
+                render(results, symbol, capital)
+            else:
+                st.error("❌ 未能获取有效股票数据，请检查代码或日期范围。")
+
+    # --- 参数寻优：各阈值的候选值做笛卡尔积 ---
+    with tab_grid:
+        col1, col2, col3 = st.columns(3)
+        pct_thrs = col1.multiselect("近30日涨幅阈值 (%)", [5.0, 7.0, 9.5, 12.0], default=[7.0, 9.5])
+        q2_floors = col2.multiselect("Q2 下限", [-40.0, -20.0, 0.0], default=[-40.0, -20.0, 0.0])
+        max_devs = col3.multiselect("MA7 偏离上限 (%)", [2.0, 3.0, 5.0], default=[2.0, 3.0, 5.0])
+        if st.button("🔍 开始参数寻优") and _valid_code(stock_code):
+            if not (pct_thrs and q2_floors and max_devs):
+                st.error("每个参数至少选择一个候选值。")
+            else:
+                st.session_state["grid_params"] = (
+                    stock_code, start_date, end_date, init_cash,
+                    tuple(sorted(pct_thrs)), tuple(sorted(q2_floors)), tuple(sorted(max_devs)),
+                )
+        grid_params = st.session_state.get("grid_params")
+        if grid_params is not None:
+            grid_df = _run(run_grid, _grid, *grid_params)
+            if grid_df is not None:
+                render_grid(grid_df)
             else:
-                st.info("所选时间段内未触发符合条件的爆发信号。")
+                st.error("❌ 未能获取有效股票数据，请检查代码或日期范围。")
 
-        else:
-            st.error("❌ 未能获取有效股票数据，请检查代码或日期范围。")
+if __name__ == "__main__":
+    main()
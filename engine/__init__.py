@@ -0,0 +1,5 @@
+from .backtest import run_backtest, simulate
+from .bars import Bars
+from .data import FetchError, fetch_bars, fetch_data_robust, fetch_sh_index
+from .indicators import add_signals, compute_signals
+from .sweep import grid_search, run_bt
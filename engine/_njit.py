@@ -0,0 +1,13 @@
+# --- numba 可选依赖 ---
+# 未安装 numba 时 njit 退化为原样返回函数：逻辑完全一致，只是失去编译加速
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # 兼容 @njit 与 @njit(cache=True) 两种写法
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+from ._njit import NUMBA_AVAILABLE, njit
+
+# --- 交易模拟内核（numba 编译；未安装 numba 时按纯 Python 执行）---
+# 显式签名：导入时即编译（MA7 由信号内核输出，恒为 float64）
+@njit([
+    'Tuple((i8[:], i8[:], i8))(f4[:], f4[:], f8[:], b1[:])',
+    'Tuple((i8[:], i8[:], i8))(f8[:], f8[:], f8[:], b1[:])',
+], cache=True, nogil=True)
+def _run_backtest_nb(close, low, ma7, xg):
+    n = close.shape[0]
+    buy_idx = np.empty(n, dtype=np.int64)
+    sell_idx = np.empty(n, dtype=np.int64)
+    holding = False
+    stop_low = 0.0
+    n_trades = 0
+
+    for i in range(n):
+        c = close[i]
+
+        # 卖出条件：持仓中 & 触发止损
+        if holding:
+            if c < stop_low or c < ma7[i]:
+                holding = False
+                sell_idx[n_trades] = i
+                n_trades += 1
+
+        # 买入条件：信号触发 & 无持仓（全仓买卖，资金曲线由成交下标事后还原）
+        if xg[i] and not holding:
+            buy_idx[n_trades] = i
+            holding = True
+            stop_low = low[i]  # 止损设为当日最低价
+
+    # 只记录成交下标；期末未平仓的买入单独返回（不计入交易清单，但资金曲线要按持仓计算）
+    open_buy = buy_idx[n_trades] if holding else -1
+    return buy_idx[:n_trades], sell_idx[:n_trades], open_buy
+
+# --- 交易模拟向量化实现（无 numba 时使用）---
+# 止损价取决于买入当日、且仅空仓时才能开仓，状态沿交易段传递，
+# 因此按“交易段”推进：每段内用布尔掩码一次性定位卖出日
+def _run_backtest_np(close, low, ma7, xg):
+    below_ma7 = close < ma7
+    entries = np.flatnonzero(xg)
+    buys, sells = [], []
+    open_buy = -1
+    pos = 0
+
+    while True:
+        k = np.searchsorted(entries, pos)
+        if k == entries.size:
+            break
+        b = entries[k]
+        # 买入次日起，首个收盘跌破止损价或 MA7 的交易日即卖出日
+        hit = np.flatnonzero(below_ma7[b + 1:] | (close[b + 1:] < low[b]))
+        if hit.size == 0:
+            open_buy = b  # 期末仍持仓
+            break
+        s = b + 1 + hit[0]
+        buys.append(b)
+        sells.append(s)
+        pos = s  # 卖出当日若有信号可再次买入
+
+    return np.array(buys, dtype=np.int64), np.array(sells, dtype=np.int64), open_buy
+
+# 有 numba 用编译内核，否则用向量化实现
+simulate = _run_backtest_nb if NUMBA_AVAILABLE else _run_backtest_np
+
+# --- 资金曲线：由成交下标整体还原（两种内核共用）---
+# 空仓段为现金常数，持仓段 (买入日, 卖出日] 为 持股数 × 收盘价，按段整体赋值，不逐日累加
+def equity_curve(close, buy_idx, sell_idx, open_buy, cash0):
+    close = close.astype(np.float64, copy=False)  # float32 行情下持股数与资金也按 float64 计算
+    n = close.shape[0]
+    history = np.empty(n)
+    cash = float(cash0)
+    prev = 0
+    for b, s in zip(buy_idx, sell_idx):
+        history[prev:b + 1] = cash
+        shares = cash / close[b]
+        history[b + 1:s + 1] = shares * close[b + 1:s + 1]
+        cash = shares * close[s]
+        prev = s + 1
+    if open_buy >= 0:
+        history[prev:open_buy + 1] = cash
+        history[open_buy + 1:] = cash / close[open_buy] * close[open_buy + 1:]
+    else:
+        history[prev:] = cash
+    return history
+
+# --- 回测入口：返回资金曲线与交易清单 ---
+def run_backtest(bars, capital):
+    close = bars.close
+    buy_idx, sell_idx, open_buy = simulate(close, bars.low, bars.ma7, bars.xg)
+    history = equity_curve(close, buy_idx, sell_idx, open_buy, capital)
+
+    # 由成交下标批量还原交易清单；只对成交日构造 date 对象，不逐行转换整列日期
+    dates = bars.date
+    # float32 行情上转 float64 会带出 10.09000015… 的尾数：A 股报价到分，先还原成两位小数，收益率也按还原后的价格计算
+    buy_px = close[buy_idx].astype(np.float64).round(2)
+    sell_px = close[sell_idx].astype(np.float64).round(2)
+    # 保留数值列，格式化交给展示层，便于后续排序与统计
+    trades = pd.DataFrame({
+        "买入日期": pd.DatetimeIndex(dates[buy_idx]).date,
+        "卖出日期": pd.DatetimeIndex(dates[sell_idx]).date,
+        "买入价": buy_px,
+        "卖出价": sell_px,
+        "区间净收益": (sell_px - buy_px) / buy_px * 100,
+    })
+    return history, trades
@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+PRICE_COLS = ('close', 'high', 'low', 'pct_chg', 'idx_c')
+
+# --- 行情与指标的列式容器（SoA）：热路径只传 ndarray，不再携带 DataFrame 的索引与块管理开销 ---
+@dataclass
+class Bars:
+    date: np.ndarray
+    close: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    pct_chg: np.ndarray
+    idx_c: np.ndarray
+    # 指标列由 add_signals 填充
+    ma7: Optional[np.ndarray] = None
+    idx_ma5: Optional[np.ndarray] = None
+    q2: Optional[np.ndarray] = None
+    xg: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df):
+        # 复制出独立的可写数组：写时复制模式下 to_numpy 返回只读视图，与 numba 内核的显式签名不匹配
+        return cls(
+            date=df['date'].to_numpy(dtype='datetime64[ns]'),
+            **{c: df[c].to_numpy(dtype=np.float32, copy=True) for c in PRICE_COLS},
+        )
+
+    def __len__(self):
+        return self.close.shape[0]
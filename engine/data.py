@@ -0,0 +1,299 @@
+import glob
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
+
+# requests-cache 可选：安装后在 HTTP 层再缓存一层，akshare 内部的辅助请求也能命中
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+# --- 环境加固 ---
+os.environ['NO_PROXY'] = '*'
+
+# --- 本地行情缓存目录（parquet，跨进程/重启共享；放在用户缓存目录，不写进代码仓库）---
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'geguhuiche')
+CACHE_MAX_AGE = 86400  # 秒，超过一天的缓存文件视为过期重新抓取
+STALE_MAX_AGE = 30 * 86400  # 网络失败时可退回使用的离线快照最长保留期
+
+# A 股交易时间按北京时间（无夏令时）判断，不依赖服务器时区
+CN_TZ = timezone(timedelta(hours=8))
+MARKET_CLOSE = dt_time(15, 30)  # 15:00 收盘，留半小时等行情源落定当日日线
+
+# --- 请求限速（令牌桶）---
+# 平时请求不等待；短时间内连续请求超出突发上限后，才按持续速率排队，避免触发上游限流
+_BUCKET_RATE = 0.5   # 每秒补充的令牌数（持续速率）
+_BUCKET_BURST = 5.0  # 桶容量（允许连续发出的请求数）
+_bucket_lock = threading.Lock()
+_bucket = {'tokens': _BUCKET_BURST, 'last': time.monotonic()}
+
+def _acquire_token():
+    with _bucket_lock:
+        now = time.monotonic()
+        tokens = min(_BUCKET_BURST, _bucket['tokens'] + (now - _bucket['last']) * _BUCKET_RATE)
+        wait = max(0.0, (1.0 - tokens) / _BUCKET_RATE)
+        # 先扣令牌再在锁外等待：余额可为负，后到的线程据此排在更后面
+        _bucket['tokens'] = tokens - 1.0
+        _bucket['last'] = now
+    if wait > 0:
+        time.sleep(wait)
+
+class _RateLimitedAdapter(HTTPAdapter):
+    # 只在真正发往网络时取令牌：requests-cache 命中的响应不经过 send，不消耗令牌也不等待
+    def send(self, request, **kwargs):
+        _acquire_token()
+        return super().send(request, **kwargs)
+
+# --- 复用 HTTP 连接 ---
+# akshare 每次请求都直接调用 requests.get（每次新建连接、重新握手 TLS），
+# 这里让它改走共享 Session：个股与指数请求复用连接池里的长连接
+HTTP_CACHE_EXPIRE = 600  # 秒，HTTP 响应缓存有效期
+
+def _make_session():
+    if requests_cache is not None:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # 上游出错时返回已过期的缓存响应，与行情层的离线快照思路一致
+            return requests_cache.CachedSession(
+                os.path.join(CACHE_DIR, 'http_cache'),
+                backend='sqlite',
+                expire_after=HTTP_CACHE_EXPIRE,
+                allowable_methods=('GET',),
+                stale_if_error=True,
+            )
+        except Exception:
+            pass  # 缓存目录不可写等情况退回普通 Session
+    return requests.Session()
+
+_SESSION = _make_session()
+_SESSION.trust_env = False  # 不读取系统代理与 .netrc（与 NO_PROXY 一致），每次请求也省去环境变量查找
+# 个股与指数在两个线程并发请求，池子留足余量；连接阶段失败（未发出请求）由适配器直接重连，
+# 读超时/断连等请求已发出的错误不在这里重试，交给 fetch_data_robust 退避重试
+_adapter = _RateLimitedAdapter(pool_connections=4, pool_maxsize=8,
+                               max_retries=Retry(total=3, connect=3, read=0))
+_SESSION.mount('https://', _adapter)
+_SESSION.mount('http://', _adapter)
+
+def _pooled_get(url, params=None, **kwargs):
+    return _SESSION.get(url, params=params, **kwargs)
+
+# 只替换 akshare 自身模块里的 requests 引用（get 之外的属性照旧指向原版 requests），
+# 进程内其他库的请求不经过这里的缓存与限速
+_ak_requests = types.ModuleType('requests')
+_ak_requests.__dict__.update(vars(requests))
+_ak_requests.get = _pooled_get
+
+for _name, _mod in list(sys.modules.items()):
+    if (_name == 'akshare' or _name.startswith('akshare.')) and getattr(_mod, 'requests', None) is requests:
+        _mod.requests = _ak_requests
+
+# --- parquet 缓存读写 ---
+def _cache_path(code: str, start, end):
+    return os.path.join(CACHE_DIR, f"{code}_{start:%Y%m%d}_{end:%Y%m%d}.parquet")
+
+def _read_cache(path, max_age=CACHE_MAX_AGE):
+    try:
+        if time.time() - os.path.getmtime(path) < max_age:
+            return pd.read_parquet(path)
+    except Exception:
+        pass  # 文件不存在或损坏：按未命中处理
+    return None
+
+def _write_cache(df, path):
+    tmp = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # 临时文件名唯一：同一进程内多个会话同时写同一个键也不会共用一个临时文件
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        os.close(fd)
+        df.to_parquet(tmp, index=False, compression='zstd')
+        os.replace(tmp, path)  # 先写临时文件再原子替换，并发读取不会读到半个文件
+        return True
+    except Exception:
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        return False  # 缓存写不进去不影响本次回测
+
+# 超过离线快照保留期的文件（及写入中断残留的临时文件）不会再被读取：写入新快照后顺带清掉，缓存目录不会无限增长
+def _prune_stale():
+    cutoff = time.time() - STALE_MAX_AGE
+    for f in glob.glob(os.path.join(CACHE_DIR, '*.parquet')) + glob.glob(os.path.join(CACHE_DIR, '*.tmp')):
+        try:
+            if os.path.getmtime(f) < cutoff:
+                os.remove(f)
+        except OSError:
+            pass
+
+# --- 日期列解析 ---
+# akshare 各版本返回的日期列可能是 'YYYY-MM-DD' 字符串、datetime.date 或已是 datetime64：
+# 已是日期类型直接返回，否则按固定格式走快速路径，格式不符时再退回自动推断
+def _to_datetime(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    try:
+        return pd.to_datetime(s, format='%Y-%m-%d', cache=True)
+    except (ValueError, TypeError):
+        return pd.to_datetime(s, cache=True)
+
+# --- 上证指数（所有个股共用，单独缓存，切换代码不重复下载）---
+# 收盘后当日指数不再变化：此时按自然日落一份 parquet，多进程/重启后当天都不再请求；
+# 盘中当日K线仍在变化，不读写快照，只靠一小时的内存缓存刷新，避免早盘取到的指数钉住一整天
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_sh_index():
+    now = datetime.now(CN_TZ)
+    closed = now.time() >= MARKET_CLOSE
+    path = os.path.join(CACHE_DIR, f"sh000001_{now:%Y%m%d}.parquet")
+    if closed:
+        idx_df = _read_cache(path)
+        if idx_df is not None:
+            return idx_df
+
+    idx_df = ak.stock_zh_index_daily(symbol="sh000001")
+    idx_df['date'] = _to_datetime(idx_df['date'])
+    idx_df = idx_df[['date', 'close']].rename(columns={'close': 'idx_c'})
+    idx_df['idx_c'] = idx_df['idx_c'].astype('float32', copy=False)
+    idx_df = idx_df.sort_values('date').reset_index(drop=True)
+    if closed and _write_cache(idx_df, path):
+        # 新快照落盘后清掉前几天的旧快照，避免缓存目录每天多一份
+        for stale in glob.glob(os.path.join(CACHE_DIR, "sh000001_*.parquet")):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+    return idx_df
+
+# 指数全历史约八千行，只截取个股日期范围参与归并；多保留起始日前一行，供首个交易日向前取值
+def _slice_index(idx_df, stock_dates):
+    dates = idx_df['date'].to_numpy()
+    lo = max(np.searchsorted(dates, stock_dates.iloc[0].to_datetime64(), side='left') - 1, 0)
+    hi = np.searchsorted(dates, stock_dates.iloc[-1].to_datetime64(), side='right')
+    return idx_df.iloc[lo:hi]
+
+# 实时行情重试用尽仍未取到：抛出而不是返回 None，st.cache_data 不缓存异常，下次点击会重新请求
+class FetchError(RuntimeError):
+    pass
+
+# --- 数据抓取函数（带字段兼容与重试）---
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def fetch_data_robust(code: str, start, end):
+    s_str = start.strftime('%Y%m%d')
+    e_str = end.strftime('%Y%m%d')
+    
+    reason = "接口返回空数据"
+    for attempt in range(3):
+        if attempt > 0:
+            time.sleep(random.uniform(1.5, 3.0) * attempt)  # 仅失败后退避重试，首次请求不再等待
+        try:
+            df = ak.stock_zh_a_hist(
+                symbol=code,
+                period="daily",
+                start_date=s_str,
+                end_date=e_str,
+                adjust="qfq"
+            )
+            
+            if df is None or df.empty:
+                continue
+
+            # 字段映射：兼容 AkShare 不同版本（2024-2026）
+            col_map = {
+                '日期': 'date',
+                '收盘': 'close',
+                '收盘价': 'close',
+                '最高': 'high',
+                '最高价': 'high',
+                '最低': 'low',
+                '最低价': 'low',
+                '涨跌幅': 'pct_chg'
+            }
+            df = df.rename(columns={k: v for k, v in col_map.items() if k in df.columns})
+
+            required_cols = ['date', 'close', 'high', 'low']
+            if not all(col in df.columns for col in required_cols):
+                st.warning(f"数据缺失关键字段: {df.columns.tolist()}")
+                return None
+
+            # 只保留策略用到的列，其余十来列（开盘、成交额、换手率…）不进入缓存与后续计算
+            df = df[[c for c in ('date', 'close', 'high', 'low', 'pct_chg') if c in df.columns]]
+            df['date'] = _to_datetime(df['date'])
+            df = df.sort_values('date').reset_index(drop=True)
+
+            # 补全 pct_chg
+            if 'pct_chg' not in df.columns:
+                # 等价于 close.pct_change() * 100，原地计算只分配一个输出数组
+                close = df['close'].to_numpy(dtype=np.float64)
+                pct = np.empty_like(close)
+                pct[:1] = np.nan
+                np.divide(close[1:], close[:-1], out=pct[1:])
+                pct[1:] -= 1
+                pct[1:] *= 100
+                df['pct_chg'] = pct
+
+            # 行情列降为 float32：指标与信号都是对这些列的多次扫描，减半内存带宽；资金曲线仍按 float64 累计
+            for c in ('close', 'high', 'low', 'pct_chg'):
+                df[c] = df[c].astype('float32', copy=False)
+            return df
+
+        except Exception as e:
+            reason = str(e)[:200]
+    raise FetchError(f"数据获取失败（{code}）: {reason}")
+
+# --- 个股行情 + 上证指数（用于大盘环境判断）---
+def fetch_bars(code: str, start, end):
+    if start > end:
+        return None  # 空区间：不发请求，也不进重试
+    path = _cache_path(code, start, end)
+    df = _read_cache(path)
+    if df is not None:
+        return df  # 命中本地缓存：个股与指数请求都省掉
+
+    # 个股与指数请求互不依赖：指数放到后台线程，与个股请求并发（线程挂上脚本上下文，才能使用缓存与提示组件）
+    # 降级结果（离线快照、指数缺失）在 df.attrs['notice'] 里带上提示，由调用方展示且不得进入结果缓存
+    with ThreadPoolExecutor(max_workers=1, initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as ex:
+        idx_future = ex.submit(fetch_sh_index)
+        try:
+            df = fetch_data_robust(code, start, end)
+        except FetchError:
+            # 实时抓取失败：退回同一区间已过期的本地快照，行情接口故障时仍可回测；快照也没有时照常抛出
+            df = _read_cache(path, max_age=STALE_MAX_AGE)
+            if df is None:
+                raise
+            df.attrs['notice'] = "⚠️ 使用离线快照：实时行情获取失败，以下结果基于此前缓存的数据"
+            return df
+    if df is None:
+        return None
+
+    try:
+        # 两边都按日期有序，merge_asof 线性归并；个股日期缺指数时取此前最近一个交易日，无需再前向填充
+        df = pd.merge_asof(df, _slice_index(idx_future.result(), df['date']), on='date', direction='backward')
+        idx_ok = True
+    except Exception as e:
+        df['idx_c'] = df['close']
+        df.attrs['notice'] = "⚠️ 无法获取上证指数，使用股价自身替代大盘信号（策略效果可能下降）"
+        idx_ok = False
+
+    # 指数缺失时的降级结果不落盘；区间含当日时当日K线盘中仍在变化，结果照常返回但不写缓存
+    if idx_ok and end < date.today() and _write_cache(df, path):
+        _prune_stale()
+    return df
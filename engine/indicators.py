@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+from ._njit import NUMBA_AVAILABLE, njit
+
+# bottleneck 可选：无 numba 时用其 C 实现的滑动最大值替代 pandas rolling
+try:
+    import bottleneck as bn
+except ImportError:
+    bn = None
+
+Q2_SPAN = 6
+# XG 信号阈值（默认值即原策略参数；参数寻优时逐组替换）
+PCT_MAX_THR = 9.5   # 近 30 日最大涨幅须超过（%）
+Q2_FLOOR = -20.0    # Q2 动能下限
+MA7_MAX_DEV = 3.0   # 收盘价偏离 MA7 上限（%）
+
+@njit(cache=True)
+def _roll_mean_step(a, i, window, state):
+    # 增量滑动均值，与 pandas rolling(window, min_periods=1).mean() 算法相同、结果逐位一致：
+    # 先移出窗口外的值再加入新值（Kahan 补偿求和，忽略 NaN），窗口内全为同一值时直接返回该值，
+    # 避免加减误差让持平的均线出现“假上涨”
+    # state: [样本数, 和, 负数个数, 加法补偿, 减法补偿, 连续相同值个数, 上一个值]
+    if i == 0:
+        state[:] = 0.0
+        state[6] = a[0]
+    if i >= window:
+        v = a[i - window]
+        if not np.isnan(v):
+            state[0] -= 1
+            y = -v - state[4]
+            t = state[1] + y
+            state[4] = t - state[1] - y
+            state[1] = t
+            if np.signbit(v):
+                state[2] -= 1
+    v = a[i]
+    if not np.isnan(v):
+        state[0] += 1
+        y = v - state[3]
+        t = state[1] + y
+        state[3] = t - state[1] - y
+        state[1] = t
+        if np.signbit(v):
+            state[2] += 1
+        state[5] = state[5] + 1 if v == state[6] else 1
+        state[6] = v
+
+    nobs = state[0]
+    if nobs <= 0:
+        return np.nan
+    if state[5] >= nobs:
+        return state[6]
+    result = state[1] / nobs
+    if state[2] == 0 and result < 0:
+        return 0.0
+    if state[2] == nobs and result > 0:
+        return 0.0
+    return result
+
+@njit(cache=True)
+def _ewm_step(state, x, alpha):
+    # 与 pandas ewm(adjust=False, ignore_na=False).mean() 的递推逐位一致：
+    # 首个有效值之前输出 NaN；遇到 NaN 输入不更新均值、但旧权重照常衰减，之后的有效值按衰减后的权重并入；
+    # 均值与新值相同时跳过计算（常数序列不引入误差）
+    # state: [当前均值, 旧权重]
+    w = state[0]
+    if not np.isnan(w):
+        state[1] *= 1.0 - alpha
+        if not np.isnan(x):
+            if w != x:
+                state[0] = (state[1] * w + alpha * x) / (state[1] + alpha)
+            state[1] = 1.0
+    elif not np.isnan(x):
+        state[0] = x
+    return state[0]
+
+# --- 指标 + 信号内核：一次遍历同时得到 MA7、大盘 MA5、Q2（双 EMA 平滑动能）与 XG 信号 ---
+# 每根K线的七个条件只依赖当日与前一日的值，可与指标递推合并在同一循环里，收盘价只扫描一遍
+# 显式签名：导入时即编译并写入磁盘缓存，首次点击回测不再等待 JIT（行情为 float32，另备 float64 通用版本）
+@njit([
+    'Tuple((f8[:], f8[:], f8[:], b1[:]))(f4[:], f4[:], f4[:], f4[:], f8, f8, f8)',
+    'Tuple((f8[:], f8[:], f8[:], b1[:]))(f8[:], f8[:], f8[:], f8[:], f8, f8, f8)',
+], cache=True, nogil=True)
+def _signals_nb(close, high, pct_chg, idx_c, pct_thr, q2_floor, max_dev):
+    n = close.shape[0]
+    ma7 = np.empty(n)
+    idx_ma5 = np.empty(n)
+    q2 = np.empty(n)
+    xg = np.zeros(n, dtype=np.bool_)
+    ma7_state = np.empty(7)
+    idx_ma5_state = np.empty(7)
+    alpha = 1.0 / (1.0 + (Q2_SPAN - 1) / 2.0)
+    # 四条 EMA（涨跌的两次平滑、绝对值的两次平滑）各自的 [均值, 旧权重]
+    ewm_state = np.empty((4, 2))
+    ewm_state[:, 0] = np.nan
+    ewm_state[:, 1] = 1.0
+    # 近 30 日最大涨幅用单调队列维护：队列内下标对应的涨幅递减，队首即窗口最大值，整体 O(n)
+    dq = np.empty(n, dtype=np.int64)
+    head = tail = 0
+
+    for i in range(n):
+        ma7[i] = _roll_mean_step(close, i, 7, ma7_state)
+        idx_ma5[i] = _roll_mean_step(idx_c, i, 5, idx_ma5_state)
+
+        # NaN 不入队（与 rolling(30, min_periods=1).max() 忽略 NaN 一致）
+        v = pct_chg[i]
+        if not np.isnan(v):
+            while tail > head and pct_chg[dq[tail - 1]] <= v:
+                tail -= 1
+            dq[tail] = i
+            tail += 1
+        while tail > head and dq[head] <= i - 30:
+            head += 1
+
+        # diff() 首项为 NaN；收盘价缺失时当日与次日的差分也为 NaN，由 _ewm_step 按 pandas 规则跳过
+        d = close[i] - close[i - 1] if i > 0 else np.nan
+        e1 = _ewm_step(ewm_state[0], d, alpha)
+        e2 = _ewm_step(ewm_state[1], e1, alpha)
+        f1 = _ewm_step(ewm_state[2], abs(d), alpha)
+        f2 = _ewm_step(ewm_state[3], f1, alpha)
+        q2[i] = 100 * e2 / (f2 + 1e-8)  # 防除零
+
+        # 首根K线无前值，shift(1) 比较恒为 False
+        if i == 0:
+            continue
+
+        pct_max30 = pct_chg[dq[head]] if tail > head else np.nan
+
+        xg[i] = (
+            idx_c[i] > idx_ma5[i] and
+            pct_max30 > pct_thr and
+            q2[i] > q2[i - 1] and
+            q2[i] > q2_floor and
+            ma7[i] > ma7[i - 1] and
+            close[i] > high[i - 1] and
+            ((close[i] - ma7[i]) / ma7[i] * 100) <= max_dev
+        )
+
+    return ma7, idx_ma5, q2, xg
+
+def _move_mean(a, window):
+    # 均值固定走 pandas：其 Kahan 补偿与常数窗口短路保证持平的均线不出现“假上涨/假跌破”，
+    # bottleneck 的朴素滑动和会在一串相同收盘价上累出误差，翻转 close < ma7 与 ma7 > ma7.shift(1)
+    return pd.Series(a).rolling(window=window, min_periods=1).mean().to_numpy()
+
+def _move_max(a, window):
+    if bn is not None and a.shape[0] > 0:
+        # 求最大值不累积误差，可放心用 bottleneck；其要求窗口不超过序列长度（min_count=1 时两者等价）
+        return bn.move_max(a, min(window, a.shape[0]), min_count=1)
+    return pd.Series(a).rolling(window=window, min_periods=1).max().to_numpy()
+
+def _shift1(a):
+    # 等价于 Series.shift(1)：整体后移一位，首位补 NaN；按原 dtype 单次分配，不经过拼接
+    out = np.empty_like(a, dtype=np.result_type(a, np.float32))
+    out[:1] = np.nan
+    out[1:] = a[:-1]
+    return out
+
+# --- 无 numba 时沿用 pandas 实现（滑动最大值优先走 bottleneck）---
+def _signals_pd(close, high, pct_chg, idx_c, pct_thr, q2_floor, max_dev):
+    ma7 = _move_mean(close, 7)
+    idx_ma5 = _move_mean(idx_c, 5)
+
+    q1 = pd.Series(close).diff()
+    q_ema1 = q1.ewm(span=Q2_SPAN, adjust=False).mean()
+    q_ema2 = q_ema1.ewm(span=Q2_SPAN, adjust=False).mean()
+    q_abs_ema1 = q1.abs().ewm(span=Q2_SPAN, adjust=False).mean()
+    q_abs_ema2 = q_abs_ema1.ewm(span=Q2_SPAN, adjust=False).mean()
+    q2 = (100 * q_ema2 / (q_abs_ema2 + 1e-8)).to_numpy()  # 防除零
+
+    pct_max30 = _move_max(pct_chg, 30)
+    # 直接在 ndarray 上比较并一次归约，省去 Series 的索引对齐与中间对象
+    xg = np.logical_and.reduce((
+        idx_c > idx_ma5,
+        pct_max30 > pct_thr,
+        q2 > _shift1(q2),
+        q2 > q2_floor,
+        ma7 > _shift1(ma7),
+        close > _shift1(high),
+        ((close - ma7) / ma7 * 100) <= max_dev,
+    ))
+    return ma7, idx_ma5, q2, xg
+
+compute_signals = _signals_nb if NUMBA_AVAILABLE else _signals_pd
+
+# --- 指标与信号生成 (XG) ---
+def add_signals(bars, pct_thr=PCT_MAX_THR, q2_floor=Q2_FLOOR, max_dev=MA7_MAX_DEV):
+    bars.ma7, bars.idx_ma5, bars.q2, bars.xg = compute_signals(
+        bars.close, bars.high, bars.pct_chg, bars.idx_c,
+        float(pct_thr), float(q2_floor), float(max_dev),
+    )
+    return bars
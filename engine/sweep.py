@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+import numpy as np
+
+from ._njit import NUMBA_AVAILABLE
+from .backtest import equity_curve, simulate
+from .bars import PRICE_COLS
+from .indicators import compute_signals
+
+TRADING_DAYS = 252
+# 并行的最小工作量（参数组数 × K线数）：实测单组回测约 100ns/根K线，
+# 界面最大网格（36 组 × 近 2000 根）串行仅约 7ms，线程调度开销就占到两成；
+# 约 200 万（串行约 0.2s）以上并行才有收益
+PARALLEL_MIN_WORK = 2_000_000
+
+# --- 单组参数回测：纯函数，输入行情数组与参数，输出绩效统计 ---
+def run_bt(arrays, params):
+    close, high, low, pct_chg, idx_c = arrays
+    ma7, _, _, xg = compute_signals(
+        close, high, pct_chg, idx_c,
+        float(params['pct_thr']), float(params['q2_floor']), float(params['max_dev']),
+    )
+    buy_idx, sell_idx, open_buy = simulate(close, low, ma7, xg)
+    capital = float(params['capital'])
+    history = equity_curve(close, buy_idx, sell_idx, open_buy, capital)
+
+    # 日收益率按资金曲线计算；年化夏普不扣无风险利率
+    rets = np.diff(history) / history[:-1]
+    std = rets.std() if rets.size > 1 else 0.0
+    sharpe = rets.mean() / std * np.sqrt(TRADING_DAYS) if std > 0 else 0.0
+    drawdown = 1 - history / np.maximum.accumulate(history)
+    return {
+        **params,
+        'n_trades': int(buy_idx.size),
+        'total_return': float(history[-1] - capital) / capital * 100,
+        'sharpe': float(sharpe),
+        'max_drawdown': float(drawdown.max()) * 100,
+    }
+
+# --- 参数寻优 ---
+# 默认串行；工作量足够大且有 numba 时才用线程并行：内核以 nogil 编译，线程间共享同一份行情数组，
+# 不必像进程池那样 fork 整个 Streamlit 服务进程或在子进程里重新导入 streamlit/akshare
+def grid_search(bars, capital, pct_thrs, q2_floors, max_devs, max_workers=None):
+    arrays = tuple(getattr(bars, c) for c in PRICE_COLS)
+    combos = [
+        {'pct_thr': p, 'q2_floor': q, 'max_dev': m, 'capital': capital}
+        for p, q, m in product(pct_thrs, q2_floors, max_devs)
+    ]
+    workers = min(max_workers or os.cpu_count() or 1, len(combos))
+    if workers <= 1 or not NUMBA_AVAILABLE or len(combos) * len(bars) < PARALLEL_MIN_WORK:
+        return [run_bt(arrays, c) for c in combos]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(lambda c: run_bt(arrays, c), combos))
@@ -0,0 +1,90 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import engine.data
+
+APP = str(Path(__file__).resolve().parent.parent / 'app.py')
+
+# --- 替身行情：按 akshare 返回的中文字段构造，随机游走中夹带涨停，保证能触发信号 ---
+def _walk(seed, dates, base):
+    rng = np.random.default_rng(seed)
+    r = rng.normal(0.002, 0.03, len(dates))
+    r[rng.random(len(dates)) < 0.03] = 0.1
+    close = np.round(base * np.exp(np.cumsum(r)), 2)
+    return close, rng
+
+def fake_stock_hist(symbol, period, start_date, end_date, adjust):
+    dates = pd.bdate_range(start_date, end_date)
+    close, rng = _walk(int(symbol), dates, 10.0)
+    return pd.DataFrame({
+        '日期': [d.date() for d in dates],
+        '收盘': close,
+        '最高': np.round(close * (1 + rng.random(len(dates)) * 0.03), 2),
+        '最低': np.round(close * (1 - rng.random(len(dates)) * 0.03), 2),
+        '涨跌幅': np.r_[0, np.round((close[1:] / close[:-1] - 1) * 100, 2)],
+    })
+
+def fake_index_daily(symbol):
+    dates = pd.bdate_range('2015-01-01', '2026-12-31')
+    close, _ = _walk(1, dates, 3000.0)
+    return pd.DataFrame({'date': [d.date() for d in dates], 'close': close})
+
+@pytest.fixture
+def fake_akshare(monkeypatch, tmp_path):
+    calls = []
+
+    def stock_hist(*args, **kwargs):
+        calls.append('hist')
+        return fake_stock_hist(*args, **kwargs)
+
+    monkeypatch.setattr(engine.data.ak, 'stock_zh_a_hist', stock_hist)
+    monkeypatch.setattr(engine.data.ak, 'stock_zh_index_daily', fake_index_daily)
+    monkeypatch.setattr(engine.data, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(engine.data.time, 'sleep', lambda s: None)  # 跳过失败重试的退避等待
+    st.cache_data.clear()
+    yield calls
+    st.cache_data.clear()
+
+def run_backtest_click(at):
+    at.sidebar.button[0].click()
+    at.run()
+
+def test_backtest_renders_metrics_and_trades(fake_akshare):
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    at.sidebar.date_input[0].set_value(pd.Timestamp('2019-01-01').date())
+    run_backtest_click(at)
+
+    assert not at.exception
+    assert [m.label for m in at.metric] == ['期末总资产', '累积回报率', '有效信号次数']
+    trades = at.dataframe[0].value
+    assert list(trades.columns) == ['买入日期', '卖出日期', '买入价', '卖出价', '区间净收益']
+    assert len(trades) > 0
+    assert (trades['买入价'] == trades['买入价'].round(2)).all()
+
+    # 下载按钮等交互引发的重跑不能清掉结果
+    at.run()
+    assert len(at.metric) == 3
+
+def test_failed_fetch_is_not_cached(fake_akshare, monkeypatch):
+    def down(*args, **kwargs):
+        raise ConnectionError('upstream down')
+
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    with monkeypatch.context() as m:
+        m.setattr(engine.data.ak, 'stock_zh_a_hist', down)
+        run_backtest_click(at)
+    assert any('数据获取失败' in e.value for e in at.error)
+    assert not at.metric
+
+    # 数据源恢复后再次点击应重新请求并正常出结果
+    run_backtest_click(at)
+    assert fake_akshare == ['hist']
+    assert not at.error
+    assert len(at.metric) == 3
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import backtest, indicators
+
+SEEDS = range(40)
+
+# --- 基准实现：原版 app.py 的 pandas 指标与逐行交易循环 ---
+def reference_signals(close, high, pct_chg, idx_c):
+    df = pd.DataFrame({'close': close, 'high': high, 'pct_chg': pct_chg, 'idx_c': idx_c})
+    df['ma7'] = df['close'].rolling(window=7, min_periods=1).mean()
+    df['idx_ma5'] = df['idx_c'].rolling(window=5, min_periods=1).mean()
+
+    q1 = df['close'].diff()
+    q_ema1 = q1.ewm(span=6, adjust=False).mean()
+    q_ema2 = q_ema1.ewm(span=6, adjust=False).mean()
+    q_abs_ema1 = q1.abs().ewm(span=6, adjust=False).mean()
+    q_abs_ema2 = q_abs_ema1.ewm(span=6, adjust=False).mean()
+    df['q2'] = 100 * q_ema2 / (q_abs_ema2 + 1e-8)
+
+    df['xg'] = (
+        (df['idx_c'] > df['idx_ma5']) &
+        (df['pct_chg'].rolling(window=30, min_periods=1).max() > 9.5) &
+        (df['q2'] > df['q2'].shift(1)) &
+        (df['q2'] > -20) &
+        (df['ma7'] > df['ma7'].shift(1)) &
+        (df['close'] > df['high'].shift(1)) &
+        (((df['close'] - df['ma7']) / df['ma7'] * 100) <= 3)
+    )
+    return tuple(df[c].to_numpy() for c in ('ma7', 'idx_ma5', 'q2', 'xg'))
+
+def reference_backtest(close, low, ma7, xg, cash):
+    # 逐行取 Python float，与原版 df.iloc[i] 的取值方式一致
+    cash = float(cash)
+    shares = 0.0
+    stop_low = 0.0
+    history, held, buys, sells = [], [], [], []
+    for i, (c, lo, m, sig) in enumerate(zip(close.tolist(), low.tolist(), ma7.tolist(), xg.tolist())):
+        history.append(cash + shares * c)
+        held.append(shares > 0)
+        if shares > 0 and (c < stop_low or c < m):
+            cash = shares * c
+            shares = 0.0
+            sells.append(i)
+        if sig and shares == 0:
+            buys.append(i)
+            shares = cash / c
+            cash = 0.0
+            stop_low = lo
+    return np.array(history), np.array(held), buys, sells
+
+# --- 合成行情：含持平段、缺失值，覆盖 float32 与 float64 ---
+def make_bars(seed, dtype, with_nan=True):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 600))
+    close = np.round(10 * np.exp(np.cumsum(rng.normal(0.003, 0.03, n))), 2)
+    if seed % 3 == 0:
+        close[n // 3:n // 3 + 30] = close[n // 3]  # 一字横盘
+    high = np.round(close * (1 + rng.random(n) * 0.02), 2)
+    low = np.round(close * (1 - rng.random(n) * 0.02), 2)
+    pct_chg = np.r_[np.nan, (close[1:] / close[:-1] - 1) * 100]
+    idx_c = np.round(3000 * np.exp(np.cumsum(rng.normal(0, 0.01, n))), 2)
+    if with_nan:
+        pct_chg[:int(rng.integers(0, 40))] = np.nan
+        idx_c[:int(rng.integers(0, 3))] = np.nan
+        close[rng.random(n) < 0.02] = np.nan  # 停牌缺失，检验 EMA 跨缺失值的递推
+    return tuple(a.astype(dtype) for a in (close, high, low, pct_chg, idx_c))
+
+def assert_signals_equal(got, want):
+    for g, w in zip(got, want):
+        np.testing.assert_array_equal(g, w)  # NaN 位置须一致，数值逐位相等
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_signals_nb_matches_reference(seed, dtype):
+    close, high, _, pct_chg, idx_c = make_bars(seed, dtype)
+    got = indicators._signals_nb(close, high, pct_chg, idx_c, 9.5, -20.0, 3.0)
+    assert_signals_equal(got, reference_signals(close, high, pct_chg, idx_c))
+
+@pytest.mark.parametrize('use_bn', [True, False])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_signals_pd_matches_reference(seed, dtype, use_bn, monkeypatch):
+    if use_bn and indicators.bn is None:
+        pytest.skip('bottleneck 未安装')
+    if not use_bn:
+        monkeypatch.setattr(indicators, 'bn', None)
+    close, high, _, pct_chg, idx_c = make_bars(seed, dtype)
+    got = indicators._signals_pd(close, high, pct_chg, idx_c, 9.5, -20.0, 3.0)
+    assert_signals_equal(got, reference_signals(close, high, pct_chg, idx_c))
+
+@pytest.mark.parametrize('kernel', [backtest._run_backtest_nb, backtest._run_backtest_np],
+                         ids=['nb', 'np'])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_backtest_matches_reference(seed, dtype, kernel):
+    close, high, low, pct_chg, idx_c = make_bars(seed, dtype)
+    ma7, _, _, xg = indicators.compute_signals(close, high, pct_chg, idx_c, 5.0, -40.0, 5.0)
+    cash = 100000
+    want_history, want_held, want_buys, want_sells = reference_backtest(close, low, ma7, xg, cash)
+
+    buy_idx, sell_idx, open_buy = kernel(close, low, ma7, xg)
+    assert buy_idx.tolist() == want_buys[:len(want_sells)]
+    assert sell_idx.tolist() == want_sells
+    assert open_buy == (want_buys[-1] if len(want_buys) > len(want_sells) else -1)
+
+    # 与原版唯一的差别：空仓日收盘价缺失时，原版 cash + 0 * NaN 得 NaN，现在记为手上的现金
+    # （即前一个有效资金值；持仓日缺价两边都是 NaN）
+    flat_nan = np.isnan(close) & ~want_held
+    want_history[flat_nan] = pd.Series(want_history).ffill().fillna(cash).to_numpy()[flat_nan]
+    np.testing.assert_array_equal(
+        backtest.equity_curve(close, buy_idx, sell_idx, open_buy, cash), want_history
+    )
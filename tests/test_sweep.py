@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from engine import sweep
+from engine.backtest import run_backtest
+from engine.bars import PRICE_COLS, Bars
+from engine.indicators import MA7_MAX_DEV, PCT_MAX_THR, Q2_FLOOR, add_signals
+
+CAPITAL = 100000.0
+METRICS = ('total_return', 'sharpe', 'max_drawdown')
+
+# 随机游走中夹带涨停，默认阈值下能触发多笔交易
+def make_bars(seed=7, n=1200):
+    rng = np.random.default_rng(seed)
+    r = rng.normal(0.002, 0.03, n)
+    r[rng.random(n) < 0.03] = 0.1
+    close = np.round(10 * np.exp(np.cumsum(r)), 2)
+    return Bars(
+        date=np.arange(n).astype('datetime64[D]').astype('datetime64[ns]'),
+        close=close.astype(np.float32),
+        high=np.round(close * (1 + rng.random(n) * 0.03), 2).astype(np.float32),
+        low=np.round(close * (1 - rng.random(n) * 0.03), 2).astype(np.float32),
+        pct_chg=np.r_[np.nan, (close[1:] / close[:-1] - 1) * 100].astype(np.float32),
+        idx_c=np.round(3000 * np.exp(np.cumsum(rng.normal(0, 0.01, n))), 2).astype(np.float32),
+    )
+
+def arrays(bars):
+    return tuple(getattr(bars, c) for c in PRICE_COLS)
+
+def params(pct_thr=PCT_MAX_THR, q2_floor=Q2_FLOOR, max_dev=MA7_MAX_DEV):
+    return {'pct_thr': pct_thr, 'q2_floor': q2_floor, 'max_dev': max_dev, 'capital': CAPITAL}
+
+def test_run_bt_agrees_with_run_backtest():
+    bars = make_bars()
+    history, trades = run_backtest(add_signals(bars), CAPITAL)
+    row = sweep.run_bt(arrays(bars), params())
+
+    assert row['n_trades'] == len(trades) > 0
+    assert row['total_return'] == (history[-1] - CAPITAL) / CAPITAL * 100
+    assert row['max_drawdown'] == (1 - history / np.maximum.accumulate(history)).max() * 100
+    rets = np.diff(history) / history[:-1]
+    assert row['sharpe'] == pytest.approx(rets.mean() / rets.std() * np.sqrt(sweep.TRADING_DAYS))
+    assert all(type(row[k]) is float for k in METRICS)
+
+def test_run_bt_without_trades():
+    row = sweep.run_bt(arrays(make_bars()), params(pct_thr=1000.0))
+    assert row['n_trades'] == 0
+    assert {k: row[k] for k in METRICS} == {'total_return': 0.0, 'sharpe': 0.0, 'max_drawdown': 0.0}
+    assert all(type(row[k]) is float for k in METRICS)
+
+def test_grid_search_covers_every_combo_in_order():
+    grid = ([7.0, 9.5], [-40.0, 0.0], [2.0, 3.0, 5.0])
+    rows = sweep.grid_search(make_bars(), CAPITAL, *grid)
+    assert [(r['pct_thr'], r['q2_floor'], r['max_dev']) for r in rows] == [
+        (p, q, m) for p in grid[0] for q in grid[1] for m in grid[2]
+    ]
+
+def test_grid_search_threaded_matches_serial(monkeypatch):
+    bars = make_bars()
+    grid = ([7.0, 9.5, 12.0], [-40.0, -20.0], [2.0, 5.0])
+    serial = sweep.grid_search(bars, CAPITAL, *grid)
+
+    # 强制走线程池分支，并确认确实用上了执行器
+    used = []
+
+    class SpyExecutor(sweep.ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            used.append(kwargs.get('max_workers'))
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(sweep, 'PARALLEL_MIN_WORK', 0)
+    monkeypatch.setattr(sweep, 'NUMBA_AVAILABLE', True)
+    monkeypatch.setattr(sweep, 'ThreadPoolExecutor', SpyExecutor)
+    threaded = sweep.grid_search(bars, CAPITAL, *grid, max_workers=4)
+
+    assert used == [4]
+    assert threaded == serial